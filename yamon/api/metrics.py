@@ -1,91 +1,116 @@
 """Metrics API endpoints"""
 
+import asyncio
+import time
+from itertools import islice
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 try:
-    from yamon.collectors.collector import MetricsCollector
+    from yamon.collectors.collector import MetricsCollector, infer_pe_split
     from yamon.history import MetricsHistory
 except ImportError:
-    from collectors.collector import MetricsCollector
+    from collectors.collector import MetricsCollector, infer_pe_split
     from history import MetricsHistory
 from typing import Optional
 
 router = APIRouter()
-collector = MetricsCollector()
+# Only called per request, not at a fixed rate
+collector = MetricsCollector(on_demand=True)
 history = MetricsHistory(max_size=120)
 
+# Requests within this many seconds of a collection share its result
+_CACHE_TTL = 0.25
+_cached_metrics = None
+_cached_at = 0.0
+_collect_lock: Optional[asyncio.Lock] = None  # created inside the running loop
+
+# SystemMetrics fields returned unchanged by /metrics
+_METRICS_FIELDS = (
+    "cpu_percent",
+    "cpu_per_core",
+    "cpu_count",
+    "pcpu_freq_mhz",
+    "ecpu_freq_mhz",
+    "memory_percent",
+    "memory_total",
+    "memory_used",
+    "memory_available",
+    "network_sent_rate",
+    "network_recv_rate",
+    "cpu_power",
+    "gpu_power",
+    "ane_power",
+    "system_power",
+    "gpu_usage",
+    "gpu_freq_mhz",
+    "ane_usage",
+)
+
+# MetricsHistory series returned by /history
+_HISTORY_FIELDS = (
+    "cpu_percent",
+    "memory_percent",
+    "network_sent_rate",
+    "network_recv_rate",
+    "cpu_power",
+    "gpu_power",
+    "ane_power",
+    "system_power",
+    "gpu_usage",
+    "ane_usage",
+)
+
+async def _collect_cached():
+    """Collect metrics, or reuse the last collection if it is fresher than _CACHE_TTL"""
+    global _cached_metrics, _cached_at, _collect_lock
+    if _cached_metrics is not None and time.monotonic() - _cached_at < _CACHE_TTL:
+        return _cached_metrics
+    
+    if _collect_lock is None:
+        _collect_lock = asyncio.Lock()
+    async with _collect_lock:
+        # Another request may have collected while we waited for the lock
+        if _cached_metrics is None or time.monotonic() - _cached_at >= _CACHE_TTL:
+            # collect() blocks on psutil/IOKit calls; keep it off the event loop.
+            # (run_in_executor rather than asyncio.to_thread, which needs 3.9+)
+            loop = asyncio.get_running_loop()
+            _cached_metrics = await loop.run_in_executor(None, collector.collect)
+            _cached_at = time.monotonic()
+            # Record each real collection once, not once per request
+            history.add_metrics(_cached_metrics)
+    return _cached_metrics
+
 @router.get("/metrics")
 async def get_metrics():
     """获取当前系统指标"""
-    metrics = collector.collect()
-    history.add_metrics(metrics)
+    metrics = await _collect_cached()
     
     # Calculate P-core and E-core percentages
     cpu_per_core = metrics.cpu_per_core
     cpu_count = metrics.cpu_count
     
     # Determine P-core and E-core counts
-    if cpu_count == 8:
-        p_core_count = 4
-        e_core_count = 4
-    elif cpu_count == 10:
-        p_core_count = 8
-        e_core_count = 2
-    elif cpu_count == 12:
-        p_core_count = 8
-        e_core_count = 4
-    elif cpu_count == 16:
-        p_core_count = 12
-        e_core_count = 4
-    else:
-        p_core_count = cpu_count // 2
-        e_core_count = cpu_count - p_core_count
-    
-    p_cores = cpu_per_core[:p_core_count] if len(cpu_per_core) >= p_core_count else []
-    e_cores = cpu_per_core[p_core_count:] if len(cpu_per_core) > p_core_count else []
+    p_core_count, _ = infer_pe_split(cpu_count)
     
-    if cpu_count > 0:
-        cpu_p_percent = (sum(p_cores) / cpu_count) if p_cores else 0.0
-        cpu_e_percent = (sum(e_cores) / cpu_count) if e_cores else 0.0
+    # Sum with islice directly over cpu_per_core instead of copying slices
+    # (same guards as the websocket payload)
+    core_count = len(cpu_per_core)
+    if cpu_count > 0 and core_count >= p_core_count:
+        cpu_p_percent = sum(islice(cpu_per_core, p_core_count)) / cpu_count
     else:
         cpu_p_percent = 0.0
+    if cpu_count > 0 and core_count > p_core_count:
+        cpu_e_percent = sum(islice(cpu_per_core, p_core_count, None)) / cpu_count
+    else:
         cpu_e_percent = 0.0
     
-    return {
-        "cpu_percent": metrics.cpu_percent,
-        "cpu_per_core": metrics.cpu_per_core,
-        "cpu_count": metrics.cpu_count,
-        "cpu_p_percent": cpu_p_percent,
-        "cpu_e_percent": cpu_e_percent,
-        "pcpu_freq_mhz": metrics.pcpu_freq_mhz,
-        "ecpu_freq_mhz": metrics.ecpu_freq_mhz,
-        "memory_percent": metrics.memory_percent,
-        "memory_total": metrics.memory_total,
-        "memory_used": metrics.memory_used,
-        "memory_available": metrics.memory_available,
-        "network_sent_rate": metrics.network_sent_rate,
-        "network_recv_rate": metrics.network_recv_rate,
-        "cpu_power": metrics.cpu_power,
-        "gpu_power": metrics.gpu_power,
-        "ane_power": metrics.ane_power,
-        "system_power": metrics.system_power,
-        "gpu_usage": metrics.gpu_usage,
-        "gpu_freq_mhz": metrics.gpu_freq_mhz,
-        "ane_usage": metrics.ane_usage,
-    }
+    # Returning the response directly skips FastAPI's jsonable_encoder pass
+    payload = {field: getattr(metrics, field) for field in _METRICS_FIELDS}
+    payload["cpu_p_percent"] = cpu_p_percent
+    payload["cpu_e_percent"] = cpu_e_percent
+    return ORJSONResponse(payload)
 
 @router.get("/history")
 async def get_history():
     """获取历史数据"""
-    return {
-        "cpu_percent": history.cpu_percent.get_values(),
-        "memory_percent": history.memory_percent.get_values(),
-        "network_sent_rate": history.network_sent_rate.get_values(),
-        "network_recv_rate": history.network_recv_rate.get_values(),
-        "cpu_power": history.cpu_power.get_values(),
-        "gpu_power": history.gpu_power.get_values(),
-        "ane_power": history.ane_power.get_values(),
-        "system_power": history.system_power.get_values(),
-        "gpu_usage": history.gpu_usage.get_values(),
-        "ane_usage": history.ane_usage.get_values(),
-    }
-
+    return ORJSONResponse({field: getattr(history, field).get_values() for field in _HISTORY_FIELDS})
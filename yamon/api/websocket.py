@@ -1,189 +1,246 @@
 """WebSocket API for real-time metrics"""
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket
 try:
-    from yamon.collectors.collector import MetricsCollector, SystemMetrics
+    from yamon.collectors.collector import MetricsCollector, SystemMetrics, infer_pe_split
     from yamon.history import MetricsHistory
 except ImportError:
-    from collectors.collector import MetricsCollector, SystemMetrics
+    from collectors.collector import MetricsCollector, SystemMetrics, infer_pe_split
     from history import MetricsHistory
 import asyncio
-import json
-from typing import Optional
+import atexit
+import logging
+import orjson
+import psutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 collector = MetricsCollector()
 history = MetricsHistory(max_size=120)
 
-# 共享的最新指标数据（线程安全）
-_latest_metrics: Optional[SystemMetrics] = None
-_metrics_lock = asyncio.Lock()
+# 收集间隔：1秒（1fps）
+_COLLECT_INTERVAL = 1.0
+
+# 单个客户端发送超时（秒），超时视为断开
+_SEND_TIMEOUT = 5.0
+
+# 专用的单线程执行器：采集是周期性的单任务，不需要默认线程池的几十个线程
+_collect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metrics-collect")
+atexit.register(_collect_executor.shutdown, wait=False)
+
+# 直接透传给前端的 SystemMetrics 字段（cpu_percent / cpu_p_percent / cpu_e_percent 另行计算）
+_PAYLOAD_FIELDS = (
+    "cpu_per_core",
+    "cpu_count",
+    "pcpu_freq_mhz",
+    "ecpu_freq_mhz",
+    "memory_percent",
+    "memory_total",
+    "memory_used",
+    "memory_available",
+    "network_sent_rate",
+    "network_recv_rate",
+    "cpu_power",
+    "gpu_power",
+    "ane_power",
+    "system_power",
+    "gpu_usage",
+    "gpu_freq_mhz",
+    "ane_usage",
+)
+
+# P 核和 E 核数量（cpu_count 在进程内不变，只计算一次）
+_P_CORE_COUNT, _E_CORE_COUNT = infer_pe_split(psutil.cpu_count(logical=True) or 0)
+
+def _build_payload(metrics: SystemMetrics) -> dict:
+    """根据采集结果构建推送给前端的数据"""
+    cpu_per_core = metrics.cpu_per_core
+    
+    # P 核和 E 核数量在进程内不变，导入时已计算好
+    p_core_count = _P_CORE_COUNT
+    e_core_count = _E_CORE_COUNT
+    
+    # 计算 P 核和 E 核的平均使用率（每个核心的使用率百分比）
+    # 用 islice 直接在原列表上求和，不切片复制
+    core_count = len(cpu_per_core)
+    if p_core_count > 0 and core_count >= p_core_count:
+        p_core_avg_usage = sum(islice(cpu_per_core, p_core_count)) / p_core_count
+    else:
+        p_core_avg_usage = 0.0
+    if e_core_count > 0 and core_count > p_core_count:
+        e_core_avg_usage = sum(islice(cpu_per_core, p_core_count, None)) / e_core_count
+    else:
+        e_core_avg_usage = 0.0
+    
+    # 计算 P 核和 E 核的算力占整个CPU最高算力的比例
+    # P核总算力 = P核数量 × P核当前频率 × P核平均使用率
+    # E核总算力 = E核数量 × E核当前频率 × E核平均使用率
+    # CPU最高算力 = P核数量 × P核最大频率 + E核数量 × E核最大频率
+    # cpu_p_percent = (P核总算力) / (CPU最高算力) × 100%
+    # cpu_e_percent = (E核总算力) / (CPU最高算力) × 100%
+    
+    # 使用从频率分布提取的最大频率，或已知规格，或估算值
+    pcpu_max_freq_mhz = None
+    ecpu_max_freq_mhz = None
+    
+    # 优先使用从频率分布提取的最大频率
+    if metrics.pcpu_max_freq_mhz is not None:
+        pcpu_max_freq_mhz = metrics.pcpu_max_freq_mhz
+    elif metrics.pcpu_freq_mhz is not None:
+        # Fallback: 使用当前频率估算（不准确，但比默认值好）
+        pcpu_max_freq_mhz = max(metrics.pcpu_freq_mhz * 1.2, 3000.0)
+    else:
+        # 最后 fallback: 使用默认值
+        pcpu_max_freq_mhz = 4000.0
+    
+    if metrics.ecpu_max_freq_mhz is not None:
+        ecpu_max_freq_mhz = metrics.ecpu_max_freq_mhz
+    elif metrics.ecpu_freq_mhz is not None:
+        # Fallback: 使用当前频率估算
+        ecpu_max_freq_mhz = max(metrics.ecpu_freq_mhz * 1.2, 2000.0)
+    else:
+        # 最后 fallback: 使用默认值
+        ecpu_max_freq_mhz = 2500.0
+    
+    # 计算 CPU 最高算力（所有核心都在最大频率下的总算力）
+    cpu_max_performance = (p_core_count * pcpu_max_freq_mhz) + (e_core_count * ecpu_max_freq_mhz)
+    
+    # 计算 P 核和 E 核的当前算力
+    pcpu_current_performance = 0.0
+    ecpu_current_performance = 0.0
+    
+    if metrics.pcpu_freq_mhz is not None and cpu_max_performance > 0:
+        # P核总算力 = P核数量 × P核当前频率 × (P核平均使用率 / 100)
+        pcpu_current_performance = p_core_count * metrics.pcpu_freq_mhz * (p_core_avg_usage / 100.0)
+        cpu_p_percent = (pcpu_current_performance / cpu_max_performance) * 100.0
+    else:
+        # 如果没有频率信息，回退到简单的使用率（P核的平均使用率就是 p_core_avg_usage）
+        cpu_p_percent = p_core_avg_usage
+    
+    if metrics.ecpu_freq_mhz is not None and cpu_max_performance > 0:
+        # E核总算力 = E核数量 × E核当前频率 × (E核平均使用率 / 100)
+        ecpu_current_performance = e_core_count * metrics.ecpu_freq_mhz * (e_core_avg_usage / 100.0)
+        cpu_e_percent = (ecpu_current_performance / cpu_max_performance) * 100.0
+    else:
+        # 如果没有频率信息，回退到简单的使用率（E核的平均使用率就是 e_core_avg_usage）
+        cpu_e_percent = e_core_avg_usage
+    
+    
+    # cpu_percent 应该是 P 核和 E 核算力占最高算力的比例之和
+    cpu_percent_scaled = cpu_p_percent + cpu_e_percent
+    
+    payload = {field: getattr(metrics, field) for field in _PAYLOAD_FIELDS}
+    payload["cpu_percent"] = cpu_percent_scaled  # P核和E核算力占最高算力的比例之和
+    payload["cpu_p_percent"] = cpu_p_percent  # P核算力占整个CPU最高算力的比例
+    payload["cpu_e_percent"] = cpu_e_percent  # E核算力占整个CPU最高算力的比例
+    return payload
+
+class MetricsBroker:
+    """后台采集任务（唯一写者）与 WebSocket 客户端之间的数据中转
+    
+    后台任务直接把每一帧推送给所有客户端，客户端处理协程只负责等待断开。
+    所有方法都只在事件循环内调用，单个引用的赋值和读取本身是原子的，无需加锁。
+    """
+    
+    def __init__(self):
+        # 读者可见：最新指标及其序列化后的 JSON 文本（每次采集只编码一次）
+        self.latest_metrics: Optional[SystemMetrics] = None
+        self.latest_payload: Optional[str] = None
+        # 第一份数据就绪事件（在事件循环内创建，避免绑定到导入时的循环）
+        self._ready: Optional[asyncio.Event] = None
+        # 已连接的 WebSocket 客户端及其正在进行的发送任务（每个客户端最多一个）
+        self._clients: Dict[WebSocket, asyncio.Task] = {}
+    
+    def start(self) -> None:
+        """在事件循环内调用，创建就绪事件"""
+        self._ready = asyncio.Event()
+    
+    def publish(self, metrics: SystemMetrics, payload: str) -> None:
+        """写入最新一帧并推送给所有客户端（写者调用）"""
+        # 每个周期都推送（前端按消息数记录历史，每条消息代表 1 秒）
+        self.latest_payload, self.latest_metrics = payload, metrics
+        self._ready.set()
+        for websocket, sending in list(self._clients.items()):
+            # 上一帧还没发完的慢客户端跳过这一帧，不排队也不阻塞后台采集
+            if sending.done():
+                self._clients[websocket] = asyncio.ensure_future(self._send(websocket, payload))
+    
+    async def subscribe(self, websocket: WebSocket) -> None:
+        """等待第一份数据后注册客户端，并立即推送最新一帧"""
+        await self._ready.wait()
+        self._clients[websocket] = asyncio.ensure_future(self._send(websocket, self.latest_payload))
+    
+    def unsubscribe(self, websocket: WebSocket) -> None:
+        sending = self._clients.pop(websocket, None)
+        if sending is not None:
+            sending.cancel()
+    
+    async def _send(self, websocket: WebSocket, payload: str) -> None:
+        """发送一帧，超时或出错视为断开"""
+        try:
+            await asyncio.wait_for(websocket.send_text(payload), timeout=_SEND_TIMEOUT)
+        except Exception:
+            # 连接关闭后发送会抛出服务器相关的异常，同样视为断开
+            logger.debug("WebSocket send failed", exc_info=True)
+            # 直接移除（不能取消正在运行的自身），再关闭连接让处理协程的 receive() 返回
+            self._clients.pop(websocket, None)
+            try:
+                await websocket.close()
+            except Exception:
+                pass
 
-# 后台收集任务
-_collection_task: Optional[asyncio.Task] = None
+broker = MetricsBroker()
 
 async def _background_collector():
     """后台任务：持续收集指标数据"""
-    global _latest_metrics
+    loop = asyncio.get_running_loop()
+    # 按固定节拍采集：下一次采集时间基于上一次的截止时间，而不是采集结束后再等 1 秒，
+    # 这样采集耗时不会累积成漂移，网络速率等差分指标的时间间隔更均匀
+    next_tick = loop.time()
     while True:
         try:
-            # 在线程池中运行同步的collect()方法，避免阻塞事件循环
-            metrics = await asyncio.to_thread(collector.collect)
-            async with _metrics_lock:
-                _latest_metrics = metrics
+            # 在专用线程中运行同步的collect()方法，避免阻塞事件循环
+            metrics = await loop.run_in_executor(_collect_executor, collector.collect)
+            # 每次采集只序列化一次，所有客户端共享同一份数据
+            payload = orjson.dumps(_build_payload(metrics)).decode()
+            broker.publish(metrics, payload)
             history.add_metrics(metrics)
-            # 收集间隔：1秒（1fps）
-            await asyncio.sleep(1.0)
-        except Exception as e:
-            print(f"Background collector error: {e}")
+            next_tick += _COLLECT_INTERVAL
+            now = loop.time()
+            if next_tick < now:
+                # 采集耗时超过一个周期（如系统休眠后）时不连续补采，从当前时间重新计时
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
+        except Exception:
+            logger.exception("Background collector error")
             await asyncio.sleep(0.5)
+            # 出错后重新计时，避免恢复时连续补采
+            next_tick = loop.time()
 
-async def start_background_collector():
-    """启动后台收集任务"""
-    global _collection_task
-    if _collection_task is None or _collection_task.done():
-        _collection_task = asyncio.create_task(_background_collector())
+def start_background_collector() -> asyncio.Task:
+    """启动后台收集任务，返回的任务由应用 lifespan 负责取消"""
+    broker.start()
+    return asyncio.create_task(_background_collector())
 
 @router.websocket("/metrics")
 async def websocket_metrics(websocket: WebSocket):
     """WebSocket 实时推送系统指标"""
     await websocket.accept()
     
-    # 确保后台收集任务已启动
-    await start_background_collector()
-    
     try:
-        while True:
-            # 读取最新数据（不等待收集完成）
-            async with _metrics_lock:
-                metrics = _latest_metrics
-            
-            if metrics is None:
-                # 如果还没有数据，等待一下
-                await asyncio.sleep(0.1)
-                continue
-            
-            # 计算 P 核和 E 核的使用率
-            cpu_count = metrics.cpu_count
-            cpu_per_core = metrics.cpu_per_core
-            
-            # 根据 CPU 核心数判断 P 核和 E 核数量
-            if cpu_count == 8:
-                # M1/M2/M3: 4P + 4E
-                p_core_count = 4
-                e_core_count = 4
-            elif cpu_count == 10:
-                # M1 Pro/Max: 8P + 2E
-                p_core_count = 8
-                e_core_count = 2
-            elif cpu_count == 12:
-                # M2 Pro/Max: 8P + 4E 或 M3 Pro: 6P + 6E
-                # 默认假设 8P + 4E
-                p_core_count = 8
-                e_core_count = 4
-            elif cpu_count == 16:
-                # M3 Max: 12P + 4E
-                p_core_count = 12
-                e_core_count = 4
-            else:
-                # 默认：前一半是 P 核
-                p_core_count = cpu_count // 2
-                e_core_count = cpu_count - p_core_count
-            
-            # 计算 P 核和 E 核的使用率
-            p_cores = cpu_per_core[:p_core_count] if len(cpu_per_core) >= p_core_count else []
-            e_cores = cpu_per_core[p_core_count:] if len(cpu_per_core) > p_core_count else []
-            
-            # 计算 P 核和 E 核的平均使用率（每个核心的使用率百分比）
-            p_core_avg_usage = (sum(p_cores) / p_core_count) if p_cores and p_core_count > 0 else 0.0
-            e_core_avg_usage = (sum(e_cores) / e_core_count) if e_cores and e_core_count > 0 else 0.0
-            
-            # 计算 P 核和 E 核的算力占整个CPU最高算力的比例
-            # P核总算力 = P核数量 × P核当前频率 × P核平均使用率
-            # E核总算力 = E核数量 × E核当前频率 × E核平均使用率
-            # CPU最高算力 = P核数量 × P核最大频率 + E核数量 × E核最大频率
-            # cpu_p_percent = (P核总算力) / (CPU最高算力) × 100%
-            # cpu_e_percent = (E核总算力) / (CPU最高算力) × 100%
-            
-            # 使用从频率分布提取的最大频率，或已知规格，或估算值
-            pcpu_max_freq_mhz = None
-            ecpu_max_freq_mhz = None
-            
-            # 优先使用从频率分布提取的最大频率
-            if metrics.pcpu_max_freq_mhz is not None:
-                pcpu_max_freq_mhz = metrics.pcpu_max_freq_mhz
-            elif metrics.pcpu_freq_mhz is not None:
-                # Fallback: 使用当前频率估算（不准确，但比默认值好）
-                pcpu_max_freq_mhz = max(metrics.pcpu_freq_mhz * 1.2, 3000.0)
-            else:
-                # 最后 fallback: 使用默认值
-                pcpu_max_freq_mhz = 4000.0
-            
-            if metrics.ecpu_max_freq_mhz is not None:
-                ecpu_max_freq_mhz = metrics.ecpu_max_freq_mhz
-            elif metrics.ecpu_freq_mhz is not None:
-                # Fallback: 使用当前频率估算
-                ecpu_max_freq_mhz = max(metrics.ecpu_freq_mhz * 1.2, 2000.0)
-            else:
-                # 最后 fallback: 使用默认值
-                ecpu_max_freq_mhz = 2500.0
-            
-            # 计算 CPU 最高算力（所有核心都在最大频率下的总算力）
-            cpu_max_performance = (p_core_count * pcpu_max_freq_mhz) + (e_core_count * ecpu_max_freq_mhz)
-            
-            # 计算 P 核和 E 核的当前算力
-            pcpu_current_performance = 0.0
-            ecpu_current_performance = 0.0
-            
-            if metrics.pcpu_freq_mhz is not None and cpu_max_performance > 0:
-                # P核总算力 = P核数量 × P核当前频率 × (P核平均使用率 / 100)
-                pcpu_current_performance = p_core_count * metrics.pcpu_freq_mhz * (p_core_avg_usage / 100.0)
-                cpu_p_percent = (pcpu_current_performance / cpu_max_performance) * 100.0
-            else:
-                # 如果没有频率信息，回退到简单的使用率（P核的平均使用率就是 p_core_avg_usage）
-                cpu_p_percent = p_core_avg_usage
-            
-            if metrics.ecpu_freq_mhz is not None and cpu_max_performance > 0:
-                # E核总算力 = E核数量 × E核当前频率 × (E核平均使用率 / 100)
-                ecpu_current_performance = e_core_count * metrics.ecpu_freq_mhz * (e_core_avg_usage / 100.0)
-                cpu_e_percent = (ecpu_current_performance / cpu_max_performance) * 100.0
-            else:
-                # 如果没有频率信息，回退到简单的使用率（E核的平均使用率就是 e_core_avg_usage）
-                cpu_e_percent = e_core_avg_usage
-            
-            
-            # cpu_percent 应该是 P 核和 E 核算力占最高算力的比例之和
-            cpu_percent_scaled = cpu_p_percent + cpu_e_percent
-            
-            # 发送数据
-            await websocket.send_json({
-                "cpu_percent": cpu_percent_scaled,  # P核和E核算力占最高算力的比例之和
-                "cpu_per_core": metrics.cpu_per_core,
-                "cpu_count": metrics.cpu_count,
-                "cpu_p_percent": cpu_p_percent,  # P核算力占整个CPU最高算力的比例
-                "cpu_e_percent": cpu_e_percent,  # E核算力占整个CPU最高算力的比例
-                "pcpu_freq_mhz": metrics.pcpu_freq_mhz,
-                "ecpu_freq_mhz": metrics.ecpu_freq_mhz,
-                "memory_percent": metrics.memory_percent,
-                "memory_total": metrics.memory_total,
-                "memory_used": metrics.memory_used,
-                "memory_available": metrics.memory_available,
-                "network_sent_rate": metrics.network_sent_rate,
-                "network_recv_rate": metrics.network_recv_rate,
-                "cpu_power": metrics.cpu_power,
-                "gpu_power": metrics.gpu_power,
-                "ane_power": metrics.ane_power,
-                "system_power": metrics.system_power,
-                "gpu_usage": metrics.gpu_usage,
-                "gpu_freq_mhz": metrics.gpu_freq_mhz,
-                "ane_usage": metrics.ane_usage,
-            })
-            
-            # 等待 1 秒（1fps）
-            await asyncio.sleep(1.0)
-            
-    except WebSocketDisconnect:
-        pass
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-
+        # 等待第一份数据，连接后立即推送一次；之后由后台任务直接推送
+        await broker.subscribe(websocket)
+        
+        # 客户端不会发消息，这里只等待断开，不再为每个客户端单独运行发送循环
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+            
+    except Exception:
+        # 连接已被关闭（如发送超时）时接收会抛出异常，同样视为断开
+        logger.debug("WebSocket closed", exc_info=True)
+    finally:
+        broker.unsubscribe(websocket)
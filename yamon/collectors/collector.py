@@ -1,14 +1,50 @@
 """System metrics collector"""
 
+import os
 import psutil
 import subprocess
 import json
 import re
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
 
-@dataclass
+# Use __slots__ on metrics dataclasses where supported (Python 3.10+):
+# faster attribute access and no per-instance __dict__
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Blocking CPU sample window (seconds) when there is no usable baseline
+_CPU_SAMPLE_INTERVAL = 0.01
+
+
+@lru_cache(maxsize=None)
+def infer_pe_split(cpu_count: int) -> Tuple[int, int]:
+    """Infer (P-core count, E-core count) from the logical CPU count
+
+    Shared by the REST and WebSocket APIs so both report the same split.
+    """
+    if cpu_count == 8:
+        # M1/M2/M3: 4P + 4E
+        return 4, 4
+    if cpu_count == 10:
+        # M1 Pro/Max: 8P + 2E
+        return 8, 2
+    if cpu_count == 12:
+        # M2 Pro/Max: 8P + 4E, or M3 Pro: 6P + 6E (assume 8P + 4E)
+        return 8, 4
+    if cpu_count == 16:
+        # M3 Max: 12P + 4E
+        return 12, 4
+    # Default: the first half are P-cores
+    p_core_count = cpu_count // 2
+    return p_core_count, cpu_count - p_core_count
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class SystemMetrics:
     """System metrics data structure"""
     # CPU
@@ -48,7 +84,15 @@ class SystemMetrics:
 class MetricsCollector:
     """Collect system metrics using psutil and Apple APIs"""
     
-    def __init__(self):
+    def __init__(self, on_demand: bool = False):
+        # on_demand: collect() is called at irregular times (e.g. per API request)
+        # rather than by a fixed-rate loop, so CPU usage and power are measured over
+        # their own short window
+        self._on_demand = on_demand
+        # Threads that already took a CPU sample. psutil keeps the non-blocking
+        # cpu_percent baseline per thread (since 5.9.6, the minimum we require),
+        # so collectors running on different threads don't reset each other's window
+        self._cpu_thread_state = threading.local()
         self._last_network_sent = 0
         self._last_network_recv = 0
         self._last_time = None
@@ -62,22 +106,25 @@ class MetricsCollector:
                 from yamon.collectors.apple_api import AppleAPICollector
             except ImportError:
                 from collectors.apple_api import AppleAPICollector
-            import os
             # Enable debug if running with sudo
             debug = os.geteuid() == 0  # Check if running as root
-            self._apple_collector = AppleAPICollector(debug=debug)
+            self._apple_collector = AppleAPICollector(debug=debug, on_demand=self._on_demand)
         except Exception:
             self._apple_collector = None
     
     def collect(self) -> SystemMetrics:
         """Collect current system metrics"""
-        import time
-        
-        # CPU (use minimal interval for faster updates, but still accurate)
-        # Note: interval=0 returns immediately but may be less accurate
-        # Using 0.01s (10ms) for a good balance between speed and accuracy
-        cpu_percent = psutil.cpu_percent(interval=0.01)
-        cpu_per_core = psutil.cpu_percent(interval=0.01, percpu=True)
+        # CPU: a fixed-rate collector uses interval=None, which doesn't block and
+        # measures since the previous call, i.e. over the whole polling interval.
+        # On-demand collection, and the first call on a thread (no baseline yet),
+        # block for a short window instead.
+        if self._on_demand or not getattr(self._cpu_thread_state, "sampled", False):
+            cpu_interval = _CPU_SAMPLE_INTERVAL
+            self._cpu_thread_state.sampled = True
+        else:
+            cpu_interval = None
+        cpu_percent = psutil.cpu_percent(interval=cpu_interval)
+        cpu_per_core = psutil.cpu_percent(interval=cpu_interval, percpu=True)
         cpu_count = psutil.cpu_count(logical=True)
         
         # Memory
@@ -139,6 +186,11 @@ class MetricsCollector:
             ane_usage=apple_metrics.ane_usage if apple_metrics else None,
         )
     
+    def close(self):
+        """Stop background processes started by the Apple API collector"""
+        if self._apple_collector is not None:
+            self._apple_collector.close()
+    
     def format_bytes(self, bytes: int) -> str:
         """Format bytes to human readable format"""
         for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -21,10 +21,17 @@ CFDictionaryRef = ctypes.c_void_p
 CFMutableDictionaryRef = ctypes.c_void_p
 CFArrayRef = ctypes.c_void_p
 CFDataRef = ctypes.c_void_p
+CFNumberRef = ctypes.c_void_p
+io_object_t = ctypes.c_uint32
 
 # Constants
 kCFAllocatorDefault = None
 kCFAllocatorNull = None
+kCFNumberSInt64Type = 4
+kIOMainPortDefault = 0
+
+# GPUPH states that count as idle when computing GPU usage
+GPU_IDLE_STATES = ("IDLE", "OFF", "DOWN")
 
 
 class IOReportError(Exception):
@@ -43,6 +50,10 @@ class IOReport:
         self._iokit = None
         self._subscription = None
         self._channels = None
+        self._prev_sample = None  # kept between sample_power_metrics() calls
+        self._prev_sample_time = 0.0
+        self._gpu_stats_key = None
+        self._gpu_utilization_key = None
         
         if self._is_macos:
             self._init_frameworks()
@@ -77,6 +88,9 @@ class IOReport:
             # Define IOReport function signatures
             self._init_ioreport()
             
+            # Define IOKit registry function signatures
+            self._init_iokit()
+            
         except Exception as e:
             raise IOReportError(f"Failed to initialize IOReport: {e}")
     
@@ -127,6 +141,10 @@ class IOReport:
         # CFArrayGetValueAtIndex
         self._core_foundation.CFArrayGetValueAtIndex.argtypes = [CFArrayRef, ctypes.c_long]
         self._core_foundation.CFArrayGetValueAtIndex.restype = CFTypeRef
+        
+        # CFNumberGetValue
+        self._core_foundation.CFNumberGetValue.argtypes = [CFNumberRef, ctypes.c_int, ctypes.c_void_p]
+        self._core_foundation.CFNumberGetValue.restype = ctypes.c_bool
     
     def _init_ioreport(self):
         """Initialize IOReport function signatures"""
@@ -205,6 +223,36 @@ class IOReport:
         self._ioreport.IOReportStateGetResidency.argtypes = [CFDictionaryRef, ctypes.c_int32]
         self._ioreport.IOReportStateGetResidency.restype = ctypes.c_int64
     
+    def _init_iokit(self):
+        """Initialize IOKit registry function signatures"""
+        # IOServiceMatching
+        self._iokit.IOServiceMatching.argtypes = [ctypes.c_char_p]
+        self._iokit.IOServiceMatching.restype = CFMutableDictionaryRef
+        
+        # IOServiceGetMatchingServices (consumes the matching dictionary)
+        self._iokit.IOServiceGetMatchingServices.argtypes = [
+            ctypes.c_uint32, CFDictionaryRef, ctypes.POINTER(io_object_t)
+        ]
+        self._iokit.IOServiceGetMatchingServices.restype = ctypes.c_int
+        
+        # IOIteratorNext
+        self._iokit.IOIteratorNext.argtypes = [io_object_t]
+        self._iokit.IOIteratorNext.restype = io_object_t
+        
+        # IORegistryEntryCreateCFProperties
+        self._iokit.IORegistryEntryCreateCFProperties.argtypes = [
+            io_object_t, ctypes.POINTER(CFMutableDictionaryRef), CFAllocatorRef, ctypes.c_uint32
+        ]
+        self._iokit.IORegistryEntryCreateCFProperties.restype = ctypes.c_int
+        
+        # IOObjectRelease
+        self._iokit.IOObjectRelease.argtypes = [io_object_t]
+        self._iokit.IOObjectRelease.restype = ctypes.c_int
+        
+        # Property keys read on every GPU utilization query
+        self._gpu_stats_key = self._cf_string_from_str("PerformanceStatistics")
+        self._gpu_utilization_key = self._cf_string_from_str("Device Utilization %")
+    
     def _cf_string_from_str(self, s: str) -> CFStringRef:
         """Create CFString from Python string (copying into CF-managed buffer)"""
         if not s:
@@ -322,6 +370,9 @@ class IOReport:
             'system_power': 0.0,
         }
         
+        gpu_usage_acc = 0.0
+        gpu_usage_samples = 0
+        
         for _ in range(samples):
             time.sleep(step_ms / 1000.0)
             cur_sample = self._ioreport.IOReportCreateSamples(
@@ -335,6 +386,11 @@ class IOReport:
             for k in acc:
                 acc[k] += metrics.get(k, 0.0)
             
+            gpu_usage = metrics.get('gpu_usage')
+            if gpu_usage is not None:
+                gpu_usage_acc += gpu_usage
+                gpu_usage_samples += 1
+            
             # release
             self._core_foundation.CFRelease(prev_sample)
             self._core_foundation.CFRelease(delta)
@@ -349,10 +405,47 @@ class IOReport:
         for k in acc:
             acc[k] /= samples
         
+        # GPU usage is only present if the GPU Stats channels were subscribed
+        if gpu_usage_samples:
+            acc['gpu_usage'] = gpu_usage_acc / gpu_usage_samples
+        
         return acc
     
+    def sample_power_metrics(self) -> Dict:
+        """
+        Get power metrics averaged over the interval since the previous call.
+        
+        The previous sample is kept between calls, so each call takes one new
+        sample and never sleeps; called once per second it covers the whole
+        second rather than a short window. The first call has no previous
+        sample and falls back to a short get_power_metrics() window.
+        
+        Only meaningful when called at a regular rate; on-demand callers
+        should use get_power_metrics() for a fixed window.
+        """
+        if not self._subscription:
+            raise IOReportError("Subscription not created")
+        
+        cur_sample = self._ioreport.IOReportCreateSamples(
+            self._subscription, self._channels, None
+        )
+        cur_time = time.monotonic()
+        prev_sample, prev_time = self._prev_sample, self._prev_sample_time
+        self._prev_sample, self._prev_sample_time = cur_sample, cur_time
+        
+        if not prev_sample:
+            return self.get_power_metrics(total_ms=100, samples=1)
+        
+        elapsed_ms = max(1, int((cur_time - prev_time) * 1000))
+        delta = self._ioreport.IOReportCreateSamplesDelta(prev_sample, cur_sample, None)
+        self._core_foundation.CFRelease(prev_sample)
+        try:
+            return self._parse_sample(delta, elapsed_ms)
+        finally:
+            self._core_foundation.CFRelease(delta)
+    
     def _parse_sample(self, sample: CFDictionaryRef, duration_ms: int) -> Dict:
-        """Parse IOReport sample to extract power metrics"""
+        """Parse IOReport sample to extract power metrics and GPU usage"""
         metrics = {
             'cpu_power': 0.0,
             'gpu_power': 0.0,
@@ -370,6 +463,10 @@ class IOReport:
         if not channels_array:
             return metrics
         
+        # GPU residency (ns) accumulated from the GPU performance state channel
+        gpu_active_residency = 0
+        gpu_total_residency = 0
+        
         # Iterate through channels
         count = self._core_foundation.CFArrayGetCount(channels_array)
         for i in range(count):
@@ -409,6 +506,23 @@ class IOReport:
                 elif "System" in channel_name or "Total" in channel_name or "All" in channel_name:
                     # Some systems expose total/soc power channel
                     metrics['system_power'] += watts
+            
+            # Parse GPU performance state residencies (GPUPH)
+            # Usage = time spent in any active P-state / total time, like powermetrics'
+            # "GPU HW active residency", but without sudo or a subprocess
+            elif group == "GPU Stats" and subgroup == "GPU Performance States" and channel_name == "GPUPH":
+                state_count = self._ioreport.IOReportStateGetCount(channel)
+                for state in range(state_count):
+                    residency = self._ioreport.IOReportStateGetResidency(channel, state)
+                    gpu_total_residency += residency
+                    state_name = self._cf_string_to_str(
+                        self._ioreport.IOReportStateGetNameForIndex(channel, state)
+                    )
+                    if state_name not in GPU_IDLE_STATES:
+                        gpu_active_residency += residency
+        
+        if gpu_total_residency > 0:
+            metrics['gpu_usage'] = gpu_active_residency / gpu_total_residency * 100.0
         
         # If system_power not provided, approximate as sum of components
         if metrics['system_power'] <= 0.0:
@@ -433,12 +547,71 @@ class IOReport:
         
         return joules
     
+    def get_gpu_utilization(self) -> Optional[float]:
+        """Read GPU "Device Utilization %" from the AGXAccelerator PerformanceStatistics
+        
+        This is the value `ioreg -c AGXAccelerator` prints, read through IOKit directly.
+        """
+        if not self._iokit or not self._gpu_stats_key:
+            return None
+        
+        matching = self._iokit.IOServiceMatching(b"AGXAccelerator")
+        if not matching:
+            return None
+        
+        iterator = io_object_t(0)
+        if self._iokit.IOServiceGetMatchingServices(kIOMainPortDefault, matching, ctypes.byref(iterator)) != 0:
+            return None
+        
+        utilization = None
+        try:
+            while utilization is None:
+                service = self._iokit.IOIteratorNext(iterator)
+                if not service:
+                    break
+                try:
+                    props = CFMutableDictionaryRef()
+                    if self._iokit.IORegistryEntryCreateCFProperties(
+                        service, ctypes.byref(props), kCFAllocatorDefault, 0
+                    ) != 0 or not props.value:
+                        continue
+                    try:
+                        stats = self._core_foundation.CFDictionaryGetValue(props, self._gpu_stats_key)
+                        if not stats:
+                            continue
+                        value = self._core_foundation.CFDictionaryGetValue(stats, self._gpu_utilization_key)
+                        number = ctypes.c_int64(0)
+                        if value and self._core_foundation.CFNumberGetValue(
+                            value, kCFNumberSInt64Type, ctypes.byref(number)
+                        ):
+                            utilization = float(number.value)
+                    finally:
+                        self._core_foundation.CFRelease(props)
+                finally:
+                    self._iokit.IOObjectRelease(service)
+        finally:
+            self._iokit.IOObjectRelease(iterator)
+        
+        return utilization
+    
     def close(self):
         """Clean up resources"""
+        if self._prev_sample:
+            self._core_foundation.CFRelease(self._prev_sample)
+            self._prev_sample = None
+        
         if self._channels:
             self._core_foundation.CFRelease(self._channels)
             self._channels = None
         
+        if self._gpu_stats_key:
+            self._core_foundation.CFRelease(self._gpu_stats_key)
+            self._gpu_stats_key = None
+        
+        if self._gpu_utilization_key:
+            self._core_foundation.CFRelease(self._gpu_utilization_key)
+            self._gpu_utilization_key = None
+        
         if self._subscription:
             # Note: IOReport subscription cleanup may need special handling
             # For now, we'll rely on Python's garbage collection
@@ -0,0 +1,165 @@
+"""Persistent powermetrics sampler for macOS
+
+powermetrics is started once in continuous mode and writes one plist document
+per sample interval to its stdout, each terminated by a NUL byte. A background
+thread parses each document as it arrives, so reading a sample is just taking
+the latest parsed dict, instead of a fork/exec and a sampler bring-up on every
+collection.
+
+Requires sudo; without it powermetrics exits immediately and no samples are read.
+"""
+
+import plistlib
+import subprocess
+import threading
+import weakref
+from typing import Optional
+
+
+# Pipe buffer size; also the chunk size for each read from stdout
+_READ_SIZE = 64 * 1024
+
+
+def _stop_process(proc: subprocess.Popen) -> None:
+    """Stop powermetrics, reap it and close its pipe (finalizer; must not reference the stream)"""
+    if proc.poll() is None:
+        proc.terminate()  # SIGTERM
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    if proc.stdout:
+        proc.stdout.close()
+
+
+def _read_loop(stream_ref: "weakref.ref[PowermetricsStream]", proc: subprocess.Popen) -> None:
+    """Parse each sample document as powermetrics writes it (reader thread)"""
+    buf = b''
+    got_sample = False
+    while True:
+        try:
+            chunk = proc.stdout.read1(_READ_SIZE)
+        except (OSError, ValueError):
+            break  # Pipe closed by close() or the finalizer
+        if not chunk:
+            break  # EOF: powermetrics exited
+        buf += chunk
+        if b'\x00' not in buf:
+            continue
+
+        # Only the newest complete document matters
+        *documents, buf = buf.split(b'\x00')
+        try:
+            sample = plistlib.loads(documents[-1].lstrip())
+        except Exception:
+            continue
+        got_sample = True
+        stream = stream_ref()
+        if stream is None:
+            return
+        stream._set_latest(proc, sample)
+        del stream
+
+    stream = stream_ref()
+    if stream is not None:
+        stream._on_exit(proc, got_sample)
+
+
+class PowermetricsStream:
+    """Long-running `powermetrics -f plist` process yielding one parsed dict per sample"""
+
+    def __init__(self, interval_ms: int = 1000, debug: bool = False):
+        self._interval_ms = interval_ms
+        self._debug = debug
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._reader: Optional[threading.Thread] = None
+        # Stops the running process on close() or at interpreter exit
+        self._finalizer: Optional[weakref.finalize] = None
+        self._latest: Optional[dict] = None
+        self._denied = False  # exited before its first sample (not root): don't respawn
+
+    def _command(self) -> list:
+        return [
+            'powermetrics',
+            '-i', str(self._interval_ms),
+            '--samplers', 'cpu_power,gpu_power,ane_power',  # Note: SMC sampler doesn't exist, system power needs SMC API
+            '--show-extra-power-info',  # Show additional power info (may include system total)
+            '-f', 'plist',
+        ]
+
+    def start(self) -> bool:
+        """Start powermetrics and its reader thread unless already running; returns whether it is running"""
+        with self._lock:
+            if self._proc is not None:
+                return True
+            if self._denied:
+                return False
+
+            try:
+                proc = subprocess.Popen(
+                    self._command(),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=None if self._debug else subprocess.DEVNULL,
+                    bufsize=_READ_SIZE,
+                )
+            except OSError:
+                return False
+
+            self._proc = proc
+            self._finalizer = weakref.finalize(self, _stop_process, proc)
+            self._latest = None
+            # The reader holds only a weak reference, so an unused stream can
+            # still be collected (its finalizer then stops powermetrics)
+            self._reader = threading.Thread(
+                target=_read_loop, args=(weakref.ref(self), proc), name="powermetrics-reader", daemon=True
+            )
+            self._reader.start()
+        return True
+
+    def _set_latest(self, proc: subprocess.Popen, sample: dict) -> None:
+        with self._lock:
+            if self._proc is proc:
+                self._latest = sample
+
+    def _on_exit(self, proc: subprocess.Popen, got_sample: bool) -> None:
+        """Called by the reader when powermetrics exits on its own"""
+        with self._lock:
+            if self._proc is not proc:
+                return  # close() took the process and cleans it up
+            # If it never produced a sample it was refused (superuser
+            # required) and would only be refused again
+            self._denied = not got_sample
+            self._proc = None
+            self._reader = None
+            self._latest = None
+            finalizer, self._finalizer = self._finalizer, None
+
+        # Reap the exited process and release the pipe
+        if finalizer is not None:
+            finalizer()
+
+    def read_sample(self) -> Optional[dict]:
+        """Return the latest sample without blocking
+
+        Returns None until the first sample arrives, or if powermetrics could
+        not be started or has exited (typically because it is not running as root).
+        """
+        if not self.start():
+            return None
+        with self._lock:
+            return self._latest
+
+    def close(self):
+        """Stop the powermetrics process and its reader thread"""
+        with self._lock:
+            self._proc = None
+            reader, self._reader = self._reader, None
+            finalizer, self._finalizer = self._finalizer, None
+            self._latest = None
+        if finalizer is not None:
+            finalizer()  # Runs at most once; the reader then sees EOF
+        if reader is not None and reader is not threading.current_thread():
+            reader.join(timeout=1)
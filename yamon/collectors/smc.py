@@ -5,7 +5,8 @@ Corrected implementation matching macmon / AppleSMC.h structures.
 import ctypes
 import ctypes.util
 import struct
-import sys
+import threading
+import weakref
 
 # --- Structures ---
 
@@ -47,6 +48,43 @@ class KeyData(ctypes.Structure):
         ("bytes", ctypes.c_uint8 * 32),
     ]
 
+_KEY_DATA_SIZE = ctypes.sizeof(KeyData)
+
+# Pre-compiled decoders for SMC data types
+_FLT = struct.Struct('<f')    # 'flt ' (little endian, as Apple Silicon reports it)
+_SP78 = struct.Struct('>h')   # 'sp78' signed 7.8 fixed point
+_UINT16 = struct.Struct('>H') # 'fpe2' (14.2 fixed point) and 'ui16'
+_UINT32 = struct.Struct('>I') # 'ui32'
+
+def make_smc_decoder(data_type, size):
+    """Return a function decoding a value of the given 4-char data type and size
+
+    The function takes any buffer (bytes or the KeyData byte array) starting
+    with the value. Returns None for unsupported types.
+    """
+    if data_type == b'flt ' and size == 4:
+        unpack = _FLT.unpack_from
+        return lambda buf: unpack(buf)[0]
+    if data_type == b'sp78' and size == 2:
+        unpack = _SP78.unpack_from
+        return lambda buf: unpack(buf)[0] / 256.0
+    if data_type == b'fpe2' and size == 2:
+        unpack = _UINT16.unpack_from
+        return lambda buf: unpack(buf)[0] / 4.0
+    if data_type == b'ui8 ' and size == 1:
+        return lambda buf: float(buf[0])
+    if data_type == b'ui16' and size == 2:
+        unpack = _UINT16.unpack_from
+        return lambda buf: float(unpack(buf)[0])
+    if data_type == b'ui32' and size == 4:
+        unpack = _UINT32.unpack_from
+        return lambda buf: float(unpack(buf)[0])
+    return None
+
+def _close_smc_conn(io_kit, conn):
+    """Close an SMC connection (finalizer; must not reference the SMC object)"""
+    io_kit.IOServiceClose(conn)
+
 class SMC:
     KERNEL_INDEX_SMC = 2
     SMC_CMD_READ_BYTES = 5
@@ -54,8 +92,22 @@ class SMC:
 
     def __init__(self, debug=False):
         self._debug = debug
+        self._io_kit = None
         self._conn = 0
-        self._init_iokit()
+        self._call_struct_method = None
+        self._finalizer = None
+        # key -> (key as uint32, KeyInfo, decoder); a key's size and type never change
+        self._key_info_cache = {}
+        # IOKit is loaded and the SMC opened on first use, not at construction
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _ensure_initialized(self):
+        if self._initialized: return
+        with self._init_lock:
+            if not self._initialized:
+                self._init_iokit()
+                self._initialized = True
 
     def _init_iokit(self):
         try:
@@ -87,6 +139,8 @@ class SMC:
                 ctypes.POINTER(ctypes.c_size_t) # outputStructureSize
             ]
             self._io_kit.IOConnectCallStructMethod.restype = ctypes.c_int
+            # Bound once: every SMC read goes through this call
+            self._call_struct_method = self._io_kit.IOConnectCallStructMethod
             
             self._open_smc()
 
@@ -99,39 +153,43 @@ class SMC:
         res = self._io_kit.IOServiceGetMatchingServices(0, matching, ctypes.byref(iterator))
         if res != 0: return
 
+        # Access mach_task_self (same for every service, look it up once)
+        task_port = 0
+        libc = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'))
+            task_port = ctypes.c_uint.in_dll(libc, "mach_task_self_").value
+        except:
+            try: task_port = libc.mach_task_self()
+            except: pass
+
         while True:
             service = self._io_kit.IOIteratorNext(iterator)
             if not service: break
             
             conn = ctypes.c_uint()
             
-            # Access mach_task_self
-            task_port = 0
-            try:
-                libc = ctypes.CDLL(ctypes.util.find_library('c'))
-                task_port = ctypes.c_uint.in_dll(libc, "mach_task_self_").value
-            except:
-                try: task_port = libc.mach_task_self()
-                except: pass
-            
             res = self._io_kit.IOServiceOpen(service, task_port, 0, ctypes.byref(conn))
             if res == 0:
                 self._conn = conn.value
+                # Closes the connection on close() or when this object is collected
+                self._finalizer = weakref.finalize(self, _close_smc_conn, self._io_kit, self._conn)
                 if self._debug: print("SMC Connected")
                 break
             self._io_kit.IOObjectRelease(service)
 
     def call_smc(self, input_data):
+        self._ensure_initialized()
         if not self._conn: return None
         
         output_data = KeyData()
-        output_size = ctypes.c_size_t(ctypes.sizeof(KeyData))
+        output_size = ctypes.c_size_t(_KEY_DATA_SIZE)
         
-        res = self._io_kit.IOConnectCallStructMethod(
+        res = self._call_struct_method(
             self._conn,
             self.KERNEL_INDEX_SMC,
             ctypes.byref(input_data),
-            ctypes.sizeof(KeyData),
+            _KEY_DATA_SIZE,
             ctypes.byref(output_data),
             ctypes.byref(output_size)
         )
@@ -157,41 +215,63 @@ class SMC:
         if out: return out.key_info
         return None
 
-    def read_key(self, key_str):
+    def _lookup_key(self, key_str):
+        """Return (key as uint32, KeyInfo, decoder), querying the SMC only on first use
+
+        The decoder is specialized to the key's data type and size (see
+        make_smc_decoder), so later reads skip the type dispatch.
+        """
+        cached = self._key_info_cache.get(key_str)
+        if cached is None:
+            info = self.read_key_info(key_str)
+            if not info: return None
+            data_type = info.data_type.to_bytes(4, 'big')
+            cached = (
+                int.from_bytes(key_str.encode(), 'big'),
+                info,
+                make_smc_decoder(data_type, info.data_size),
+            )
+            self._key_info_cache[key_str] = cached
+        return cached
+
+    def _read_key_raw(self, key_str):
+        """Read a key, returning ((key, KeyInfo, decoder), output KeyData) or None"""
         if len(key_str) != 4: return None
         
-        info = self.read_key_info(key_str)
-        if not info: return None
+        lookup = self._lookup_key(key_str)
+        if not lookup: return None
         
-        k_int = int.from_bytes(key_str.encode(), 'big')
         kd = KeyData()
-        kd.key = k_int
-        kd.key_info = info
+        kd.key = lookup[0]
+        kd.key_info = lookup[1]
         kd.data8 = self.SMC_CMD_READ_BYTES
         
         out = self.call_smc(kd)
         if not out: return None
         
+        return lookup, out
+
+    def read_key(self, key_str):
+        result = self._read_key_raw(key_str)
+        if not result: return None
+        (_, info, _), out = result
         return bytes(out.bytes)[:info.data_size]
 
+    def read_value(self, key_str):
+        """Read a key and decode it according to its SMC data type"""
+        result = self._read_key_raw(key_str)
+        if not result: return None
+        (_, _, decoder), out = result
+        if decoder is None: return None
+        return decoder(out.bytes)
+
     def get_system_power(self):
-        # Read PSTR
-        val = self.read_key("PSTR")
-        if val:
-            # PSTR is usually 4 bytes float (flt) or 2 bytes fixed point (sp78)
-            # macmon treats it as f32 if 4 bytes? 
-            # macmon: f32::from_le_bytes
-            
-            # Try Little Endian Float first (like macmon)
-            if len(val) == 4:
-                return struct.unpack('<f', val)[0]
-                
-        return None
+        # Read PSTR (total system power in watts)
+        # Usually 'flt ' (4-byte little endian float, like macmon) but older
+        # firmware reports fixed point 'sp78'
+        return self.read_value("PSTR")
 
     def close(self):
-        if self._conn:
-            self._io_kit.IOServiceClose(self._conn)
-            self._conn = 0
-    
-    def __del__(self):
-        self.close()
+        if self._finalizer is not None:
+            self._finalizer()  # Runs at most once
+        self._conn = 0
@@ -1,6 +1,7 @@
 """History data storage and management"""
 
 from collections import deque
+from itertools import islice
 from typing import List, Optional
 from dataclasses import dataclass
 
@@ -29,7 +30,13 @@ class HistoryBuffer:
     
     def get_latest(self, count: int) -> List[float]:
         """Get latest N values"""
-        return list(self._data)[-count:]
+        if count <= 0:
+            # Keep list slicing semantics: [-0:] is everything, [1:] for -1, ...
+            return list(self._data)[-count:]
+        # Walk only the tail from the right end instead of copying the whole buffer
+        latest = list(islice(reversed(self._data), count))
+        latest.reverse()
+        return latest
     
     def clear(self) -> None:
         """Clear all history"""
@@ -44,6 +51,21 @@ class HistoryBuffer:
         return len(self._data)
 
 
+# Scalar series recorded by MetricsHistory (None values are skipped)
+_SERIES_FIELDS = (
+    "cpu_percent",
+    "memory_percent",
+    "network_sent_rate",
+    "network_recv_rate",
+    "cpu_power",
+    "gpu_power",
+    "ane_power",
+    "system_power",
+    "gpu_usage",
+    "ane_usage",
+)
+
+
 class MetricsHistory:
     """Store history for all metrics"""
     
@@ -70,6 +92,12 @@ class MetricsHistory:
         # GPU/ANE
         self.gpu_usage = HistoryBuffer(max_size)
         self.ane_usage = HistoryBuffer(max_size)
+        
+        # (field, bound HistoryBuffer.add) for every scalar series, so add_metrics
+        # is one loop without per-field attribute lookups
+        self._appenders = tuple(
+            (field, getattr(self, field).add) for field in _SERIES_FIELDS
+        )
     
     def update_cpu_cores(self, core_count: int) -> None:
         """Initialize per-core history buffers"""
@@ -79,35 +107,15 @@ class MetricsHistory:
     
     def add_metrics(self, metrics) -> None:
         """Add current metrics to history"""
-        # CPU
-        self.cpu_percent.add(metrics.cpu_percent)
-        
-        # Per-core CPU
-        self.update_cpu_cores(len(metrics.cpu_per_core))
-        for i, core_value in enumerate(metrics.cpu_per_core):
-            if i in self.cpu_per_core:
-                self.cpu_per_core[i].add(core_value)
+        # Scalar series (power and GPU/ANE usage only if available)
+        for field, add in self._appenders:
+            value = getattr(metrics, field)
+            if value is not None:
+                add(value)
         
-        # Memory
-        self.memory_percent.add(metrics.memory_percent)
-        
-        # Network
-        self.network_sent_rate.add(metrics.network_sent_rate)
-        self.network_recv_rate.add(metrics.network_recv_rate)
-        
-        # Power (only if available)
-        if metrics.cpu_power is not None:
-            self.cpu_power.add(metrics.cpu_power)
-        if metrics.gpu_power is not None:
-            self.gpu_power.add(metrics.gpu_power)
-        if metrics.ane_power is not None:
-            self.ane_power.add(metrics.ane_power)
-        if metrics.system_power is not None:
-            self.system_power.add(metrics.system_power)
-        
-        # GPU/ANE usage
-        if metrics.gpu_usage is not None:
-            self.gpu_usage.add(metrics.gpu_usage)
-        if metrics.ane_usage is not None:
-            self.ane_usage.add(metrics.ane_usage)
-
+        # Per-core CPU (buffers only need to be created when the core count grows)
+        cpu_per_core = metrics.cpu_per_core
+        if len(cpu_per_core) > len(self.cpu_per_core):
+            self.update_cpu_cores(len(cpu_per_core))
+        for i, core_value in enumerate(cpu_per_core):
+            self.cpu_per_core[i].add(core_value)
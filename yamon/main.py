@@ -1,12 +1,16 @@
 """FastAPI application entry point"""
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import ORJSONResponse, Response
 from pathlib import Path
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from typing import Optional, Tuple
+import asyncio
+import hashlib
 import os
+import time
 
 # Import from yamon package
 from yamon.api import metrics, websocket
@@ -15,11 +19,22 @@ from yamon.api import metrics, websocket
 async def lifespan(app: FastAPI):
     """应用生命周期管理：启动和停止后台任务"""
     # 启动时：启动后台数据收集任务
-    await websocket.start_background_collector()
+    collector_task = websocket.start_background_collector()
     yield
-    # 关闭时：清理资源（如果需要）
+    # 关闭时：停止后台任务，避免重载后遗留仍在采集的任务
+    collector_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await collector_task
+    # 停止 powermetrics 等采集器启动的子进程
+    websocket.collector.close()
+    metrics.collector.close()
 
-app = FastAPI(title="Yamon API", version="1.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="Yamon API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # CORS 配置（开发环境需要）
 # 在生产环境中，静态文件和 API 同源，不需要 CORS
@@ -29,8 +44,9 @@ if os.getenv("ENV") != "production":
         CORSMiddleware,
         allow_origins=["http://localhost:5173"],  # Vite dev server
         allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
+        allow_methods=["GET"],  # API 只有 GET 接口
+        allow_headers=["Content-Type"],
+        max_age=86400,  # 浏览器缓存预检结果一天
     )
 
 # API 路由
@@ -51,6 +67,42 @@ for dir_path in possible_static_dirs:
         static_dir = dir_path
         break
 
+# index.html 缓存在内存中并带 ETag；最多每 5 秒检查一次 mtime，前端重新构建后无需重启
+_INDEX_RECHECK_INTERVAL = 5.0
+_index_body = b""
+_index_etag = ""
+_index_mtime = None
+_index_checked_at = 0.0
+
+def _load_index() -> Optional[Tuple[bytes, str]]:
+    """Return (body, etag) of index.html, re-reading it only when its mtime changes"""
+    global _index_body, _index_etag, _index_mtime, _index_checked_at
+    now = time.monotonic()
+    if _index_mtime is None or now - _index_checked_at >= _INDEX_RECHECK_INTERVAL:
+        _index_checked_at = now
+        index_path = static_dir / "index.html"
+        try:
+            mtime = index_path.stat().st_mtime_ns
+        except OSError:
+            _index_mtime = None
+            return None
+        if mtime != _index_mtime:
+            _index_body = index_path.read_bytes()
+            _index_etag = '"%s"' % hashlib.sha256(_index_body).hexdigest()[:32]
+            _index_mtime = mtime
+    return _index_body, _index_etag
+
+def _index_response(request: Request) -> Optional[Response]:
+    """index.html from memory, or 304 if the client already has this version"""
+    index = _load_index()
+    if index is None:
+        return None
+    body, etag = index
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="text/html", headers=headers)
+
 if static_dir:
     # 如果存在静态文件，serve 它们
     assets_dir = static_dir / "assets"
@@ -58,23 +110,23 @@ if static_dir:
         app.mount("/assets", StaticFiles(directory=str(assets_dir)), name="assets")
     
     @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
+    async def serve_spa(full_path: str, request: Request):
         """Serve SPA - 所有非 API 路由都返回 index.html"""
         if full_path.startswith("api") or full_path.startswith("ws"):
             return {"error": "Not found"}
         
-        index_path = static_dir / "index.html"
-        if index_path.exists():
-            return FileResponse(str(index_path))
+        response = _index_response(request)
+        if response is not None:
+            return response
         return {"error": "Static files not found"}
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """根路径"""
     if static_dir:
-        index_path = static_dir / "index.html"
-        if index_path.exists():
-            return FileResponse(str(index_path))
+        response = _index_response(request)
+        if response is not None:
+            return response
     return {"message": "Yamon API", "docs": "/docs"}
 
 if __name__ == "__main__":